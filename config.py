@@ -115,7 +115,9 @@ class Schema:
     File schema for the LSICorrelator
     """
 
-    FILE_SCHEME = """{datetime}
+    # The file is written section by section (header, correlation function, count rate history
+    # header, count rate history) rather than being formatted into one string first
+    FILE_HEADER_SCHEME = """{datetime}
 Pseudo Cross Correlation
 Scattering angle:\t{scattering_angle:.1f}
 Duration (s):\t{duration:d}
@@ -132,6 +134,8 @@ Cumulant 2nd\t-Inf\tNaN
 Cumulant 3rd\t-Inf\tNaN
 
 Lag time (s)         g2-1
-{correlation_function}
+"""
+
+    COUNT_RATE_HISTORY_HEADER = """
 Count Rate History (KHz)  CR CHA / CR CHB
-{count_rate_history}"""
+"""
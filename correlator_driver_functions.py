@@ -4,17 +4,14 @@ data from the correlator API.
 """
 # pylint: disable=wrong-import-position
 
-from __future__ import absolute_import, division, print_function, unicode_literals
-
-import os
-import sys
 import traceback
 from functools import wraps
 from time import sleep
 from typing import Dict, TextIO, Tuple
 
-sys.path.insert(1, os.path.join(os.getenv("EPICS_KIT_ROOT"), "support", "lsicorr_vendor", "master"))
-sys.path.insert(2, os.path.join(os.getenv("EPICS_KIT_ROOT"), "ISIS", "inst_servers", "master"))
+# pylint: disable=wrong-import-order
+# Adds the paths LSICorrelator and server_common are imported from, so must come first
+import dependency_paths  # noqa: F401  # isort: skip  # pylint: disable=unused-import
 
 import numpy as np  # pylint: disable=import-error
 from LSICorrelator import (
@@ -26,7 +23,6 @@ from server_common.utilities import (
 
 from config import Constants, Macro
 from data_file_interaction import DataArrays, DataFile
-from mocked_correlator_api import MockedCorrelatorAPI
 
 
 def _error_handler(func):
@@ -74,6 +70,11 @@ class LSiCorrelatorVendorInterface:
         )
 
         if simulated:
+            # Only needed in simulation, so the mock (and its dependency on mock) is not
+            # imported when talking to a real device
+            # pylint: disable=import-outside-toplevel
+            from mocked_correlator_api import MockedCorrelatorAPI
+
             self.mocked_api = MockedCorrelatorAPI()
             self.device = self.mocked_api.device
         else:
@@ -97,12 +98,10 @@ class LSiCorrelatorVendorInterface:
         time lag is greater than or equal to min_time_lag and Time lags that are greater
         than min_time_lag
         """
-        indices = [count for count in range(0, len(lags)) if lags[count] < min_time_lag]
-
-        lags = np.delete(lags, indices)
-        corr = np.delete(corr, indices)
+        # Keep anything not below the minimum (this keeps NaN lags, as comparisons with NaN fail)
+        keep = ~(lags < min_time_lag)
 
-        return lags, corr
+        return lags[keep], corr[keep]
 
     def get_data_as_arrays(
         self, min_time_lag
@@ -121,16 +120,18 @@ class LSiCorrelatorVendorInterface:
             trace_B (ndarray): Raw photon counts for channel B
             trace_time (ndarray): Time trace constructed from length of raw data
         """
-        corr = np.asarray(self.device.Correlation)
-        lags = np.asarray(self.device.Lags)
+        corr = np.asarray(self.device.Correlation, dtype=np.float64)
+        lags = np.asarray(self.device.Lags, dtype=np.float64)
 
         lags, corr = self.remove_data_with_time_lags_lower_than_minimum(lags, corr, min_time_lag)
 
-        lags = lags[np.isfinite(corr)]
-        corr = corr[np.isfinite(corr)]
+        finite = np.isfinite(corr)
+        lags = lags[finite]
+        corr = corr[finite]
 
-        trace_a = np.asarray(self.device.TraceChA)
-        trace_b = np.asarray(self.device.TraceChB)
+        # Copy the traces, as the device may reuse their buffers when it takes more data
+        trace_a = np.array(self.device.TraceChA, copy=True)
+        trace_b = np.array(self.device.TraceChB, copy=True)
 
         # Time axis is number of data points collected * scaling factor
         trace_time = np.arange(len(trace_a)) * Constants.DELTA_T
@@ -167,6 +168,30 @@ class LSiCorrelatorVendorInterface:
             self.corr = corr
             self.lags = lags
 
+    def get_data_arrays(self, min_time_lag: float) -> DataArrays:
+        """
+        Collects the data to save from the device, so that it can be written to file while the
+        device takes more data.
+        @param min_time_lag (float): The minimum time lag to include.
+        @return (DataArrays): The correlation function, time lags and traces
+        """
+        return DataArrays(*self.get_data_as_arrays(min_time_lag))
+
+    @staticmethod
+    def write_data(
+        data_arrays: DataArrays, user_file: TextIO, archive_file: TextIO, metadata: Dict
+    ) -> None:
+        """
+        Write previously collected data to file.
+        @param data_arrays (DataArrays): The data to write to the file.
+        @param user_file (TextIO): The file to write the user data to.
+        @param archive_file (TextIO): The file to write the archive data to.
+        @param metadata (Dict): The metadata to write to the file.
+        @return: None
+        """
+        data_file = DataFile.create_file_data(data_arrays, user_file, archive_file, metadata)
+        data_file.write_to_file()
+
     def save_data(
         self, min_time_lag: float, user_file: TextIO, archive_file: TextIO, metadata: Dict
     ) -> None:  # pylint: disable=line-too-long
@@ -178,7 +203,4 @@ class LSiCorrelatorVendorInterface:
         @param metadata (Dict): The metadata to write to the file.
         @return: None
         """
-        correlation, time_lags, trace_a, trace_b, trace_time = self.get_data_as_arrays(min_time_lag)
-        data_arrays = DataArrays(correlation, time_lags, trace_a, trace_b, trace_time)
-        data_file = DataFile.create_file_data(data_arrays, user_file, archive_file, metadata)
-        data_file.write_to_file()
+        self.write_data(self.get_data_arrays(min_time_lag), user_file, archive_file, metadata)
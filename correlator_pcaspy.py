@@ -2,49 +2,97 @@
 Correlator pcaspy and IOC Elements of the LSiCorrelator IOC
 """
 
-from __future__ import absolute_import, division, print_function, unicode_literals
-
 import argparse
 import os
+import queue
+import string
 import sys
+import threading
 import time
 import traceback
 
 # pylint: disable=wrong-import-position
-from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime
-from typing import Any, Dict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-sys.path.insert(1, os.path.join(os.getenv("EPICS_KIT_ROOT"), "support", "lsicorr_vendor", "master"))
-sys.path.insert(2, os.path.join(os.getenv("EPICS_KIT_ROOT"), "ISIS", "inst_servers", "master"))
+# pylint: disable=wrong-import-order
+# Adds the inst_servers path that server_common is imported from, so must come first
+import dependency_paths  # noqa: F401  # isort: skip  # pylint: disable=unused-import
 
-from BlockServer.core.file_path_manager import FILEPATH_MANAGER  # pylint: disable=import-error
+import numpy as np  # pylint: disable=import-error
 from pcaspy import Driver, SimpleServer  # pylint: disable=import-error
 from pcaspy.alarm import Alarm, Severity  # pylint: disable=import-error
-from server_common.channel_access import ChannelAccess  # pylint: disable=import-error
-from server_common.helpers import (  # pylint: disable=import-error
-    get_macro_values,
-    register_ioc_start,
-)
 from server_common.utilities import print_and_log  # pylint: disable=import-error
 
 from config import PV, Constants, Defaults, LSiPVSeverity, Macro
 from correlator_driver_functions import LSiCorrelatorVendorInterface, _error_handler
+from data_file_interaction import DataArrays
 from pvdb import STATIC_PV_DATABASE, Records
+from record import Record, null_device_setter
 
 NANOSECONDS_TO_SECONDS = 1e9
+FILENAME_TIMESTAMP_FORMAT = "%Y-%m-%dT%H_%M_%S"
+# Time the CA server waits for socket activity per call to process. Monitors posted from the
+# acquisition thread are only sent when this wait ends, so this bounds their latency. A shorter
+# wait is used while a measurement is running, when those monitors are posted.
+SERVER_PROCESS_TIMEOUT = 0.1
+ACTIVE_SERVER_PROCESS_TIMEOUT = 0.01
+HEARTBEAT_PV = "HEARTBEAT"
+HEARTBEAT_INTERVAL = 1.0
+
+# Lookup tables built once at import, rather than searching the Records enum on every PV access
+_RECORD_BY_NAME = {record.name: record.value for record in Records}
+_RECORD_NAMES = tuple(_RECORD_BY_NAME)
+_SETPOINT_BY_PV = {
+    name: record.sp_name for name, record in _RECORD_BY_NAME.items() if record.has_setpoint
+}
+_BASE_PV_BY_SETPOINT = {setpoint: name for name, setpoint in _SETPOINT_BY_PV.items()}
+_VAL_FIELD_BY_PV = {
+    **{name: record.val_name for name, record in _RECORD_BY_NAME.items()},
+    **{setpoint: f"{setpoint}.VAL" for setpoint in _BASE_PV_BY_SETPOINT},
+}
+_NORD_FIELD_BY_PV = {
+    name: f"{name}.NORD"
+    for name, record in _RECORD_BY_NAME.items()
+    if "count" in record.pv_definition
+}
+
+# (name, convert_from_pv) of each metadata record, in the order they are saved
+_METADATA_CONVERTERS = tuple(
+    (record.name, record.value.convert_from_pv) for record in Defaults.metadata_records
+)
+
+# (status, severity) to apply to all records, keyed on whether the device is disconnected
+_DISCONNECTED_ALARMS = {
+    True: (Alarm.TIMEOUT_ALARM, Severity.INVALID_ALARM),
+    False: (Alarm.NO_ALARM, Severity.NO_ALARM),
+}
+
 
+# Acquisitions are long-running so get their own single worker. PV writes are applied in order
+# by the driver's write worker thread.
+ACQUISITION_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lsi-acq")
+# Data files are written in the background, so the next repetition does not wait on disk I/O
+FILE_WRITE_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lsi-io")
+FILE_BUFFER_SIZE = 1 << 20
 
-def get_base_pv(reason: str) -> str:
+
+class _FilenameCharTable(dict):
     """
-    Trims trailing :SP off a PV name
-    @param reason (str): The PV name to trim
-    @return (str): The trimmed PV name
+    str.translate table which keeps ascii alphanumerics and dashes/underscores and deletes
+    anything else. Deleted characters are added to the table as they are first seen, rather
+    than building an entry for every unicode code point up front.
     """
-    return reason[:-3]
+
+    def __missing__(self, codepoint: int) -> None:
+        self[codepoint] = None
 
 
-THREADPOOL = ThreadPoolExecutor()
+_FILENAME_CHAR_TABLE = _FilenameCharTable(
+    (ord(char), ord(char)) for char in string.ascii_letters + string.digits + "-_"
+)
 
 
 def remove_non_ascii(text_to_check: str) -> str:
@@ -53,9 +101,7 @@ def remove_non_ascii(text_to_check: str) -> str:
     @param text_to_check (str): The text to check
     @return (str): The cleaned text
     """
-    # Remove anything other than alphanumerics and dashes/underscores
-    parsed_text = [char for char in text_to_check if char.isalnum() or char in "-_"]
-    return "".join(parsed_text)
+    return text_to_check.translate(_FILENAME_CHAR_TABLE)
 
 
 class LSiCorrelatorIOC(Driver):
@@ -76,21 +122,39 @@ class LSiCorrelatorIOC(Driver):
             self.user_filepath = macros[Macro.FILEPATH.name]
         except KeyError as key_error:
             raise RuntimeError(
-                f"No file path specified to save data to: {key_error}".format(key_error)
+                f"No file path specified to save data to: {key_error}"
             ) from key_error
 
         self.simulated = macros[Macro.SIMULATE.name] == "1"  # type: bool
         if self.simulated:
             print("WARNING! Started in simulation mode")
+        # Directories (with trailing separator) that data file names are appended to
+        self._user_file_prefix = os.path.join(self.user_filepath, "")
+        self._archive_file_prefix = os.path.join(
+            self.user_filepath if self.simulated else Constants.DATA_DIR, ""
+        )
 
         self.driver = LSiCorrelatorVendorInterface(macros, simulated=self.simulated)
+        # Device setters bound to the device, for the records which have one
+        self._device_setters = {
+            name: partial(record.set_on_device, self.driver.device)
+            for name, record in _RECORD_BY_NAME.items()
+            if record.set_on_device is not null_device_setter
+        }
         self.macros = macros
         self.pv_prefix = pv_prefix
         self.already_started = False
+        self.dae_pv_names = {pv: pv.add_prefix(prefix=pv_prefix) for pv in PV}
+        self.dae_values = {}  # type: Dict[PV, Any]
+        self.monitor_dae_values()
+        # Per-thread nesting depth of _batched_updates blocks
+        self._batch_state = threading.local()
+        # Set when there are PV updates waiting to be posted by flush_pv_updates
+        self._flush_requested = False
+        self.heartbeat = 0
 
         # Set up the PV database
-        defaults = Defaults.defaults
-        defaults[Records.CONNECTED.value] = self.driver.is_connected
+        defaults = {**Defaults.defaults, Records.CONNECTED.value: self.driver.is_connected}
 
         self.alarm_status = Alarm.NO_ALARM
         self.alarm_severity = Severity.NO_ALARM
@@ -101,12 +165,56 @@ class LSiCorrelatorIOC(Driver):
                 LSiPVSeverity.MAJOR.value,
             )
 
-        for record, default_value in defaults.items():
-            # Write defaults to device
-            print_and_log(f"setting {record.name} to default {default_value}")
-            self.update_pv_and_write_to_device(record.name, record.convert_to_pv(default_value))
+        self.write_defaults(defaults)
+
+        # PV writes are queued by write() and applied in order by a single worker thread
+        self._write_queue = queue.Queue()  # type: queue.Queue
+        threading.Thread(target=self._process_writes, name="lsi-write", daemon=True).start()
+
+    def write_defaults(self, defaults: Dict[Record, Any]) -> None:
+        """
+        Writes default values to the device and PVs, logging them in a single message and
+        posting them to clients in a single update
+        @param defaults (Dict[Record, Any]): The default value for each record, in the form
+        used by the device
+        """
+        defaults_text = ", ".join(f"{record.name}={value}" for record, value in defaults.items())
+        print_and_log(f"setting defaults: {defaults_text}")
+        with self._batched_updates():
+            for record, default_value in defaults.items():
+                self.update_pv_and_write_to_device(record.name, record.convert_to_pv(default_value))
+
+    def flush_pv_updates(self) -> None:
+        """
+        Posts PV updates to clients, if any have been made since the last flush. Called
+        periodically from the server loop so that bursts of writes are posted together.
+        """
+        if self._flush_requested:
+            self._flush_requested = False
+            self.updatePVs()
 
-        self.updatePVs()
+    def update_heartbeat(self) -> None:
+        """
+        Increments the heartbeat PV, to be posted to clients on the next flush
+        """
+        self.heartbeat += 1
+        self.setParam(HEARTBEAT_PV, self.heartbeat)
+        self._flush_requested = True
+
+    @contextmanager
+    def _batched_updates(self) -> Iterator[None]:
+        """
+        Posts the PV updates made by this thread in the block to clients with a single call to
+        updatePVs as soon as the block ends, rather than waiting for the next periodic flush.
+        Blocks may be nested, in which case updates are posted at the end of the outermost block.
+        """
+        self._batch_state.depth = getattr(self._batch_state, "depth", 0) + 1
+        try:
+            yield
+        finally:
+            self._batch_state.depth -= 1
+            if self._batch_state.depth == 0:
+                self.updatePVs()
 
     def update_error_pv_print_and_log(
         self, error: str, severity: LSiPVSeverity = LSiPVSeverity.INFO, src: str = "LSI"
@@ -126,34 +234,31 @@ class LSiCorrelatorIOC(Driver):
         @param in_alarm (bool): Whether to set the disconnected alarms or
         not (True = set, False = clear)
         """
-        if in_alarm:
-            severity = Severity.INVALID_ALARM
-            status = Alarm.TIMEOUT_ALARM
-        else:
-            severity = Severity.NO_ALARM
-            status = Alarm.NO_ALARM
+        status, severity = _DISCONNECTED_ALARMS[bool(in_alarm)]
 
         self.alarm_status = status
         self.alarm_severity = severity
 
-        for record in Records:
-            self.setParamStatus(record.name, status, severity)
+        set_param_status = self.setParamStatus
+        with self._batched_updates():
+            for name in _RECORD_NAMES:
+                set_param_status(name, status, severity)
 
     def get_converted_pv_value(self, reason: str) -> Any:
         """
         If the supplied reason has a defining record, applies the convert_from_pv
         transformation to current pv value else returns current pv value.
+        The value is taken from pcaspy's param table with getParam, which does not post anything
+        to clients (only updatePVs does), so this is cheap to call repeatedly.
         @param reason (str): The name of the PV to get the value of (without the prefix)
         @return (Any): The converted PV value
         """
-        pv_value = self.read(reason)
-        try:
-            record = Records[reason].value
-            sanitised_value = record.convert_from_pv(pv_value)
-        except KeyError:
+        pv_value = self.getParam(reason)
+        record = _RECORD_BY_NAME.get(reason)
+        if record is None:
             # reason has no defining record
-            sanitised_value = pv_value
-        return sanitised_value
+            return pv_value
+        return record.convert_from_pv(pv_value)
 
     def update_param_and_fields(self, reason: str, value: Any) -> None:
         """
@@ -163,7 +268,8 @@ class LSiCorrelatorIOC(Driver):
         """
         try:
             self.setParam(reason, value)
-            self.setParam(f"{reason}.VAL", value)
+            # pcaspy does not alias fields, reason.VAL is a separate PV in the database
+            self.setParam(_VAL_FIELD_BY_PV.get(reason) or f"{reason}.VAL", value)
             self.setParamStatus(reason, self.alarm_status, self.alarm_severity)
         except ValueError as err:
             self.update_error_pv_print_and_log(f"Error setting PV {reason} to {value}:")
@@ -182,18 +288,16 @@ class LSiCorrelatorIOC(Driver):
         (defaults to False) - if True, reason:SP pv will be updated
         """
 
-        try:
-            record = Records[reason]
-        except KeyError:
+        record = _RECORD_BY_NAME.get(reason)
+        if record is None:
             self.update_error_pv_print_and_log(f"Can't update PV {reason}, PV not found")
-            record = None
-
-        if record is not None:
+        else:
             # Need to go through both input sanitisers to make sure we set enum values correctly
-            value_for_lsi_driver = record.value.convert_from_pv(value)
-            new_pv_value = record.value.convert_to_pv(value_for_lsi_driver)
+            value_for_lsi_driver, new_pv_value = record.sanitise(value)
+            device_setter = self._device_setters.get(reason)
             try:
-                record.value.set_on_device(self.driver.device, value_for_lsi_driver)
+                if device_setter is not None:
+                    device_setter(value_for_lsi_driver)
             except ValueError as error:
                 self.update_error_pv_print_and_log(f"Can't update PV {reason}, invalid value")
                 self.update_error_pv_print_and_log(str(error))
@@ -202,42 +306,129 @@ class LSiCorrelatorIOC(Driver):
                 # No error raised, set new value to pv/params
                 self.update_param_and_fields(reason, new_pv_value)
                 if update_setpoint:
-                    self.update_param_and_fields(f"{reason}:SP", new_pv_value)
+                    self.update_param_and_fields(_SETPOINT_BY_PV[reason], new_pv_value)
 
-        # Update PVs after any write
-        self.updatePVs()
+        # Post the update to clients on the next flush
+        self._flush_requested = True
 
-    def set_array_pv_value(self, reason: str, value: Any) -> None:
+    def set_status_pv(self, reason: str, value: bool) -> None:
         """
-        Helper function to update the value of an array PV and the array PV fields (NORD)
+        Sets a status PV that only reports the IOC's state (e.g. RUNNING or WAITING), skipping
+        the lookup, conversion and device setter of update_pv_and_write_to_device.
+        @param reason (str): The name of the PV to set
+        @param value (bool): The new value of the PV
+        """
+        self.update_param_and_fields(reason, value)
+        # Post the update to clients on the next flush
+        self._flush_requested = True
+
+    def set_array_pv_values(self, array_values: List[Tuple[str, Any]]) -> None:
+        """
+        Helper function to update the values of array PVs and the array PV fields (NORD),
+        posting all of the changes to clients in a single update. Array PVs have no device
+        setter or converters, so the params are set directly.
+        @param array_values (List[Tuple[str, Any]]): (name of the PV to set, new value) pairs
+        """
+
+        with self._batched_updates():
+            for reason, value in array_values:
+                # Hand pcaspy a contiguous float array, only copying if value is not one already
+                value = np.ascontiguousarray(value, dtype=np.float64)
+                self.update_param_and_fields(reason, value)
+                self.setParam(_NORD_FIELD_BY_PV[reason], len(value))
+
+    def write(self, reason: str, value: Any) -> bool:
+        """
+        Handle write to PV, by queueing it to be applied by the write worker thread
         @param reason (str): The name of the PV to set
         @param value (Any): The new value to set the PV to
+        @return (bool): True, the write has been accepted
         """
+        # Writes of the current value are dropped by the worker, which checks them against the
+        # PV once every earlier queued write has been applied
+        self._write_queue.put((reason, value))
+        return True
 
-        self.update_pv_and_write_to_device(reason, value)
-        self.setParam(f"{reason}.NORD", len(value))
+    def _process_writes(self) -> None:
+        """
+        Applies queued PV writes in the order they were made. Consecutive writes to the same PV
+        which are queued together are coalesced, so only the latest of them is applied, and the
+        resulting updates are posted to clients at once.
+        """
+        while True:
+            pending_writes = [self._write_queue.get()]
+            writes_taken = 1
+            while True:
+                try:
+                    write = self._write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                writes_taken += 1
+                # Only coalesce with the previous write, so writes are never reordered (e.g. a
+                # setpoint written before START is applied before the acquisition starts)
+                if write[0] == pending_writes[-1][0]:
+                    pending_writes[-1] = write
+                else:
+                    pending_writes.append(write)
+
+            try:
+                with self._batched_updates():
+                    for reason, value in pending_writes:
+                        self._apply_write(reason, value)
+            # pylint: disable=broad-except
+            except Exception:
+                # Keep the worker alive, so later writes are still applied
+                print_and_log(traceback.format_exc(), src="lsi ")
+            finally:
+                for _ in range(writes_taken):
+                    self._write_queue.task_done()
 
     @_error_handler
-    def write(self, reason: str, value: Any) -> None:
+    def _apply_write(self, reason: str, value: Any) -> None:
         """
-        Handle write to PV
+        Applies a write to a PV, starting an acquisition if the write is to START
         @param reason (str): The name of the PV to set
         @param value (Any): The new value to set the PV to
         """
 
         print_and_log(f"LSiCorrelatorDriver: Processing PV write for reason {reason} value {value}")
         if reason == Records.START.name and not self.already_started:
-            THREADPOOL.submit(self.take_data)
+            # Mark the acquisition as started before it is submitted, so that a later START in
+            # the same burst of writes is rejected rather than queueing a second acquisition
+            self.already_started = True
+            ACQUISITION_POOL.submit(self.take_data)
         elif reason == Records.START.name and self.already_started:
             self.update_error_pv_print_and_log("LSI --- Cannot configure: Measurement active")
+        elif self._is_unchanged(reason, value):
+            # Nothing to update on the device or PVs
+            return
 
-        if reason.endswith(":SP"):
+        base_pv = _BASE_PV_BY_SETPOINT.get(reason)
+        if base_pv is not None:
             # Update both SP and non-SP fields
-            THREADPOOL.submit(
-                self.update_pv_and_write_to_device, get_base_pv(reason), value, update_setpoint=True
-            )
+            self.update_pv_and_write_to_device(base_pv, value, update_setpoint=True)
         else:
-            THREADPOOL.submit(self.update_pv_and_write_to_device, reason, value)
+            self.update_pv_and_write_to_device(reason, value)
+
+    def _is_unchanged(self, reason: str, value: Any) -> bool:
+        """
+        Whether writing a scalar value to a PV would leave it, and its base PV if it is a
+        setpoint, at their current values. Array values and writes to START (which start an
+        acquisition) are never treated as unchanged.
+        @param reason (str): The name of the PV being written to
+        @param value (Any): The value being written
+        @return (bool): True if the write would not change any values
+        """
+        if (
+            reason == Records.START.name
+            or reason not in _VAL_FIELD_BY_PV
+            or not isinstance(value, (int, float, str))
+        ):
+            return False
+        base_pv = _BASE_PV_BY_SETPOINT.get(reason)
+        if base_pv is not None and self.getParam(base_pv) != value:
+            return False
+        return self.getParam(reason) == value
 
     @_error_handler
     def read(self, reason: str) -> Any:
@@ -247,21 +438,17 @@ class LSiCorrelatorIOC(Driver):
         @return (Any): The value of the PV
         """
 
-        self.updatePVs()  # Update PVs before any read so that they are up to date.
-        if reason.endswith(":SP"):
-            pv_value = self.getParam(get_base_pv(reason))
-        else:
-            pv_value = self.getParam(reason)
-        return pv_value
+        # Setpoints read back the value of their base PV
+        return self.getParam(_BASE_PV_BY_SETPOINT.get(reason, reason))
 
     def wait(self, wait_in_seconds) -> None:
         """
         Wait for a specified number of seconds
         @param wait_in_seconds (float): The number of seconds to wait
         """
-        self.update_pv_and_write_to_device(Records.WAITING.name, True)
+        self.set_status_pv(Records.WAITING.name, True)
         time.sleep(wait_in_seconds)
-        self.update_pv_and_write_to_device(Records.WAITING.name, False)
+        self.set_status_pv(Records.WAITING.name, False)
 
     @_error_handler
     def take_data(self) -> None:
@@ -270,44 +457,71 @@ class LSiCorrelatorIOC(Driver):
         from the LSi Correlator with the given number of repetitions.
         Sends IOC into alarm if no data is returned (as the correlator may be disconnected).
         """
+        pending_save = None
         try:
-            self.driver.configure()
-        except RuntimeError as error:
-            self.update_error_pv_print_and_log(str(error))
-
-        no_repetitions = self.get_converted_pv_value(Records.REPETITIONS.name)
-        wait_in_seconds = self.get_converted_pv_value(Records.WAIT.name)
-        wait_at_start = self.get_converted_pv_value(Records.WAIT_AT_START.name)
-        min_time_lag_ns = self.get_converted_pv_value(Records.MIN_TIME_LAG.name)
-        # Convert min time lag to seconds for comparison against lag data
-        min_time_lag = min_time_lag_ns / NANOSECONDS_TO_SECONDS
-        self.already_started = True
-        first_repetition = 1
-
-        self.update_pv_and_write_to_device(Records.TAKING_DATA.name, True)
-
-        for repeat in range(first_repetition, no_repetitions + 1):
-            self.update_pv_and_write_to_device(Records.CURRENT_REPETITION.name, repeat)
-
-            if repeat == first_repetition and wait_at_start or repeat != first_repetition:
-                self.wait(wait_in_seconds)
-
-            self.update_pv_and_write_to_device(Records.RUNNING.name, True)
-            self.driver.take_data(min_time_lag)
-            self.update_pv_and_write_to_device(Records.RUNNING.name, False)
-
-            if self.driver.has_data:
-                self.set_array_pv_value(Records.CORRELATION_FUNCTION.name, self.driver.corr)
-                self.set_array_pv_value(Records.LAGS.name, self.driver.lags)
-
-                # Save data to file
-                with open(self.get_user_filename(), "w+", encoding="utf-8") as user_file, open(
-                    self.get_archive_filename(), "w+", encoding="utf-8"
-                ) as archive_file:
-                    self.driver.save_data(
-                        min_time_lag, user_file, archive_file, self.get_metadata()
+            try:
+                self.driver.configure()
+            except RuntimeError as error:
+                self.update_error_pv_print_and_log(str(error))
+
+            no_repetitions = self.get_converted_pv_value(Records.REPETITIONS.name)
+            wait_in_seconds = self.get_converted_pv_value(Records.WAIT.name)
+            wait_at_start = self.get_converted_pv_value(Records.WAIT_AT_START.name)
+            min_time_lag_ns = self.get_converted_pv_value(Records.MIN_TIME_LAG.name)
+            # Convert min time lag to seconds for comparison against lag data
+            min_time_lag = min_time_lag_ns / NANOSECONDS_TO_SECONDS
+            self.update_dae_values()
+            metadata = self.get_metadata()
+            self.already_started = True
+            first_repetition = 1
+
+            self.set_status_pv(Records.TAKING_DATA.name, True)
+
+            for repeat in range(first_repetition, no_repetitions + 1):
+                self.update_pv_and_write_to_device(Records.CURRENT_REPETITION.name, repeat)
+
+                if repeat == first_repetition and wait_at_start or repeat != first_repetition:
+                    self.wait(wait_in_seconds)
+
+                self.set_status_pv(Records.RUNNING.name, True)
+                self.driver.take_data(min_time_lag)
+                pending_save = self._end_repetition(min_time_lag, metadata, pending_save)
+        finally:
+            if pending_save is not None:
+                # Let the last save finish before another acquisition can start. Its error is
+                # reported here, unless it is the error the loop is already raising.
+                save_error = pending_save.exception()
+                if save_error is not None and save_error is not sys.exc_info()[1]:
+                    self.update_error_pv_print_and_log(
+                        f"LSiCorrelatorDriver: Error saving data: {save_error}",
+                        LSiPVSeverity.MAJOR,
                     )
-            else:
+
+            # Also runs if the acquisition fails, so the IOC does not stay marked as started
+            with self._batched_updates():
+                self.set_status_pv(Records.TAKING_DATA.name, False)
+                self.already_started = False
+                # Set start PV back to NO, purely for aesthetics (this PV is actually always ready)
+                self.update_param_and_fields(Records.START.name, 0)
+                self.update_param_and_fields(_SETPOINT_BY_PV[Records.START.name], 0)
+
+    def _end_repetition(
+        self, min_time_lag: float, metadata: Dict, pending_save: Optional[Future]
+    ) -> Optional[Future]:
+        """
+        Posts the end of a repetition (running state, data arrays and output file name) to
+        clients in one update, and starts saving the data in the background.
+        Sends IOC into alarm if no data was returned (as the correlator may be disconnected).
+        @param min_time_lag (float): The minimum time lag to include in the saved data
+        @param metadata (Dict): The metadata to write to the data files
+        @param pending_save (Optional[Future]): The save of the previous repetition's data, if any
+        @return (Optional[Future]): The save of this repetition's data, or pending_save if there
+        is no data to save
+        """
+        with self._batched_updates():
+            self.set_status_pv(Records.RUNNING.name, False)
+
+            if not self.driver.has_data:
                 # No data returned, correlator may be disconnected
                 self.update_pv_and_write_to_device(Records.CONNECTED.name, False)
                 self.update_error_pv_print_and_log(
@@ -315,73 +529,146 @@ class LSiCorrelatorIOC(Driver):
                     LSiPVSeverity.INVALID,
                 )
                 self.set_disconnected_alarms(True)
+                return pending_save
 
-        self.update_pv_and_write_to_device(Records.TAKING_DATA.name, False)
-        self.already_started = False
-        # Set start PV back to NO, purely for aesthetics (this PV is actually always ready)
-        self.update_param_and_fields(Records.START.name, 0)
-        self.update_param_and_fields(f"{Records.START.name}:SP", 0)
+            self.set_array_pv_values(
+                [
+                    (Records.CORRELATION_FUNCTION.name, self.driver.corr),
+                    (Records.LAGS.name, self.driver.lags),
+                ]
+            )
+
+            # Collect the data now, as the device overwrites it when taking more data
+            data_arrays = self.driver.get_data_arrays(min_time_lag)
+            # Save data to file, using the same timestamp and run number for the user and
+            # archive files
+            timestamp = time.strftime(FILENAME_TIMESTAMP_FORMAT)
+            run_number = self.dae_values.get(PV.RUNNUMBER)
+            user_filename = self.get_user_filename(timestamp, run_number)
+            archive_filename = self.get_archive_filename(timestamp, run_number)
+
+        if pending_save is not None:
+            # Only allow one save to be outstanding at a time, raising any error from it
+            pending_save.result()
+        return FILE_WRITE_POOL.submit(
+            self.save_data, data_arrays, user_filename, archive_filename, metadata
+        )
+
+    def save_data(
+        self, data_arrays: DataArrays, user_filename: str, archive_filename: str, metadata: Dict
+    ) -> None:
+        """
+        Writes collected data to the user and archive data files. Run in the background by
+        take_data, which reports any error from it when it next waits for the save to finish.
+        @param data_arrays (DataArrays): The data to write
+        @param user_filename (str): The path of the user data file
+        @param archive_filename (str): The path of the archive data file
+        @param metadata (Dict): The metadata to write to the files
+        """
+        with open(
+            user_filename, "w+", encoding="utf-8", buffering=FILE_BUFFER_SIZE
+        ) as user_file, open(
+            archive_filename, "w+", encoding="utf-8", buffering=FILE_BUFFER_SIZE
+        ) as archive_file:
+            self.driver.write_data(data_arrays, user_file, archive_file, metadata)
 
     def get_metadata(self) -> Dict:
         """
         Get the metadata to be saved with the data
         @return (Dict): A dictionary containing meta data to be saved
         """
-        metadata = {}
-        metadata_records = Defaults.metadata_records
-        for record in metadata_records:
-            metadata[record.name] = self.get_converted_pv_value(record.name)
-        return metadata
+        return {name: convert(self.getParam(name)) for name, convert in _METADATA_CONVERTERS}
+
+    def monitor_dae_values(self) -> None:
+        """
+        Adds channel access monitors on the DAE PVs used to build data filenames (run number,
+        instrument name and title), so their latest values are held in dae_values without
+        a caget for every file.
+
+        If device is simulated do not attempt to monitor values from channel access.
+        """
+        if self.simulated:
+            return
+        # pylint: disable=import-error, import-outside-toplevel
+        from server_common.channel_access import ChannelAccess
+
+        for pv in PV:
+            ChannelAccess.add_monitor(
+                self.dae_pv_names[pv],
+                partial(self._set_dae_value, pv),
+                to_string=True,
+            )
+
+    def _set_dae_value(self, pv: PV, value: Any, *_) -> None:
+        """
+        Monitor callback which stores the latest value of a DAE PV
+        @param pv (PV): The DAE PV which has been updated
+        @param value (Any): The new value of the PV
+        """
+        self.dae_values[pv] = value
 
-    def get_archive_filename(self) -> str:
+    def update_dae_values(self) -> None:
+        """
+        Reads any DAE PVs used to build data filenames whose monitors have not yet supplied a value
+        from channel access.
+
+        If device is simulated do not attempt to get values from channel access.
+        """
+        if self.simulated:
+            return
+        # pylint: disable=import-error, import-outside-toplevel
+        from server_common.channel_access import ChannelAccess
+
+        for pv in PV:
+            if pv not in self.dae_values:
+                self.dae_values[pv] = ChannelAccess.caget(self.dae_pv_names[pv])
+
+    def get_archive_filename(self, timestamp: str, run_number: Any) -> str:
         """
         Returns a filename which the archive data file will be saved with.
 
         If device is simulated do not attempt to get instrument name or run number
         from channel access.
         If simulated save file in user directory instead of usual data directory.
+        @param timestamp (str): The timestamp to include in the filename
+        @param run_number (Any): The run number to include in the filename
         @return (str): Filename to save archive data to
         """
         if self.simulated:
-            full_filename = os.path.join(
-                self.user_filepath, Constants.SIMULATE_ARCHIVE_DAT_FILE_NAME
-            )
+            filename = Constants.SIMULATE_ARCHIVE_DAT_FILE_NAME
         else:
-            timestamp = datetime.now().strftime("%Y-%m-%dT%H_%M_%S")
-            run_number = ChannelAccess.caget(PV.RUNNUMBER.add_prefix(prefix=self.pv_prefix))
-            instrument = ChannelAccess.caget(PV.INSTNAME.add_prefix(prefix=self.pv_prefix))
+            instrument = self.dae_values[PV.INSTNAME]
             filename = f"{instrument}{run_number}_DLS_{timestamp}.txt"
 
-            full_filename = os.path.join(Constants.DATA_DIR, filename)
-        return full_filename
+        return f"{self._archive_file_prefix}{filename}"
 
-    def get_user_filename(self) -> str:
+    def get_user_filename(self, timestamp: str, run_number: Any) -> str:
         """
         Returns a filename given the current run number and title.
 
         If device is simulated do not attempt to get run number or title from channel access
+        @param timestamp (str): The timestamp to include in the filename
+        @param run_number (Any): The run number to include in the filename
         @return (str): Filename to save user data to
         """
 
         if self.simulated:
             filename = Constants.SIMULATE_USER_DAT_FILE_NAME
         else:
-            run_number = ChannelAccess.caget(PV.RUNNUMBER.add_prefix(prefix=self.pv_prefix))
             print_and_log(f"run number = {run_number}")
-            timestamp = datetime.now().strftime("%Y-%m-%dT%H_%M_%S")  # pylint: disable=unused-variable
 
             experiment_name = self.get_converted_pv_value(Records.EXPERIMENTNAME.name)
 
             if experiment_name == "":
                 # No name supplied, use run title
-                experiment_name = ChannelAccess.caget(PV.TITLE.add_prefix(prefix=self.pv_prefix))
+                experiment_name = self.dae_values[PV.TITLE]
 
             # Remove characters that are not allowed in filename and replace with underscore (_)
             compressed_experiment_name = remove_non_ascii(experiment_name)  # pylint: disable=unused-variable
             filename = f"{run_number}_{compressed_experiment_name}_{timestamp}.dat"
 
         # Update last used filename PV
-        full_filename = os.path.join(self.user_filepath, filename)
+        full_filename = f"{self._user_file_prefix}{filename}"
         self.update_pv_and_write_to_device(Records.OUTPUTFILE.name, full_filename)
 
         return full_filename
@@ -398,9 +685,7 @@ def serve_forever(ioc_name: str, pv_prefix: str, macros: Dict[str, str]) -> None
     @return: None
     """
 
-    ioc_name_with_pv_prefix = "{pv_prefix}{ioc_name}:".format(
-        pv_prefix=pv_prefix, ioc_name=ioc_name
-    )  # pylint: disable=line-too-long, consider-using-f-string
+    ioc_name_with_pv_prefix = f"{pv_prefix}{ioc_name}:"
     print_and_log(ioc_name_with_pv_prefix)
     server = SimpleServer()
 
@@ -408,21 +693,33 @@ def serve_forever(ioc_name: str, pv_prefix: str, macros: Dict[str, str]) -> None
 
     # Run heartbeat IOC, this is done with a different prefix
     server.createPV(
-        prefix="f{pv_prefix}CS:IOC:{ioc_name}:DEVIOS:",
-        pvdb={"HEARTBEAT": {"type": "int", "value": 0}},
+        prefix=f"{pv_prefix}CS:IOC:{ioc_name}:DEVIOS:",
+        pvdb={HEARTBEAT_PV: {"type": "int", "value": 0}},
     )
 
-    # Looks like it does nothing, but this creates *and automatically registers* the driver
-    # (via metaclasses in pcaspy). See declaration of DriverType in pcaspy/driver.py for details
-    # of how it achieves this.
+    # This creates *and automatically registers* the driver (via metaclasses in pcaspy). See
+    # declaration of DriverType in pcaspy/driver.py for details of how it achieves this.
+    # A reference is kept so that pending PV updates can be flushed from the server loop.
+    driver = LSiCorrelatorIOC(pv_prefix, macros)
 
-    LSiCorrelatorIOC(pv_prefix, macros)
+    # pylint: disable=import-error, import-outside-toplevel
+    from server_common.helpers import register_ioc_start
 
     register_ioc_start(ioc_name, STATIC_PV_DATABASE, ioc_name_with_pv_prefix)
 
+    # Periodic tasks are run from the server loop, so no other threads are needed for them
+    process = server.process
+    last_heartbeat = time.monotonic()
     try:
         while True:
-            server.process(0.1)
+            process(
+                ACTIVE_SERVER_PROCESS_TIMEOUT if driver.already_started else SERVER_PROCESS_TIMEOUT
+            )
+            now = time.monotonic()
+            if now - last_heartbeat >= HEARTBEAT_INTERVAL:
+                last_heartbeat = now
+                driver.update_heartbeat()
+            driver.flush_pv_updates()
     except Exception:
         print_and_log(traceback.format_exc())
         raise
@@ -444,6 +741,11 @@ def main():
 
     args = parser.parse_args()
 
+    # Imported once the arguments are valid, as the block server brings in a large dependency tree
+    # pylint: disable=import-error, import-outside-toplevel
+    from BlockServer.core.file_path_manager import FILEPATH_MANAGER
+    from server_common.helpers import get_macro_values
+
     FILEPATH_MANAGER.initialise(os.path.normpath(os.getenv("ICPCONFIGROOT")), "", "")
 
     print("IOC started")
@@ -2,9 +2,8 @@
 Contains the data_file_interaction class which is used to interact with the data file.
 """
 
+import time
 from dataclasses import dataclass
-from datetime import datetime
-from io import StringIO
 from typing import Dict, TextIO, Tuple
 
 import numpy as np  # pylint: disable=import-error
@@ -12,6 +11,11 @@ import numpy as np  # pylint: disable=import-error
 from config import Schema
 from pvdb import Records
 
+# Row formats matching np.savetxt(..., delimiter="\t", fmt=...) for each table in the file
+CORRELATION_ROW_FORMAT = "%1.6e\t%1.6e\n"
+RAW_CHANNEL_ROW_FORMAT = "%.6f\t%.6f\t%.6f\n"
+FILE_DATETIME_FORMAT = "%m/%d/%Y\t%H:%M %p"
+
 
 @dataclass
 class DataArrays:
@@ -19,6 +23,8 @@ class DataArrays:
     A data transfer object to store the relevant data ndarrays.
     """
 
+    __slots__ = ("correlation", "time_lags", "trace_a", "trace_b", "trace_time")
+
     correlation: np.ndarray
     time_lags: np.ndarray
     trace_a: np.ndarray
@@ -68,41 +74,43 @@ class DataFile:
         self.user_file: TextIO = user_file
         self.archive_file: TextIO = archive_file
         self.metadata: Dict = metadata
-        self.save_file = None
+        self.file_sections: Tuple[str, ...] = ()
 
-    def _format_correlation_and_raw_channel_data(self) -> Tuple[StringIO, StringIO]:
+    def _format_correlation_and_raw_channel_data(self) -> Tuple[str, str]:
         """
         A private method to format the correlation function and raw channel data to write to file.
         @return (Tuple): A tuple (str, str) of the correlation function and raw channel data
         to write to file.
         """
 
-        correlation_data = np.vstack((self.data_arrays.time_lags, self.data_arrays.correlation)).T
+        # column_stack gives C-contiguous rows, so ravel() below doesn't need to copy
+        correlation_data = np.column_stack(
+            (self.data_arrays.time_lags, self.data_arrays.correlation)
+        )
 
-        raw_channel_data = np.vstack(
+        raw_channel_data = np.column_stack(
             (self.data_arrays.trace_time, self.data_arrays.trace_a, self.data_arrays.trace_b)
-        ).T
-
-        correlation_file = StringIO()
-        np.savetxt(correlation_file, correlation_data, delimiter="\t", fmt="%1.6e")
-        correlation_string = correlation_file.getvalue()
-        raw_channel_data_file = StringIO()
-        np.savetxt(raw_channel_data_file, raw_channel_data, delimiter="\t", fmt="%.6f")
-        raw_channel_data_string = raw_channel_data_file.getvalue()
+        )
+
+        # Format every row with a single % operation rather than np.savetxt's per-row loop
+        correlation_string = (CORRELATION_ROW_FORMAT * len(correlation_data)) % tuple(
+            correlation_data.ravel().tolist()
+        )
+        raw_channel_data_string = (RAW_CHANNEL_ROW_FORMAT * len(raw_channel_data)) % tuple(
+            raw_channel_data.ravel().tolist()
+        )
         return correlation_string, raw_channel_data_string
 
     def _structure_file_data(self, correlation_string, raw_channel_data_string) -> None:
         """
-        Write the correlation function, time lags, traces and metadata to user and archive files.
-        @param correlation_string (StringIO): The correlation function to write to file.
-        @param raw_channel_data_string (StringIO): The raw channel data to write to file.
+        Structure the correlation function, time lags, traces and metadata into the sections of
+        the file.
+        @param correlation_string (str): The correlation function to write to file.
+        @param raw_channel_data_string (str): The raw channel data to write to file.
         @return (None): None
         """
-        correlation_string, raw_channel_data_string = (
-            self._format_correlation_and_raw_channel_data()
-        )  # pylint: disable=line-too-long
-        self.save_file = Schema.FILE_SCHEME.format(
-            datetime=datetime.now().strftime("%m/%d/%Y\t%H:%M %p"),
+        header = Schema.FILE_HEADER_SCHEME.format(
+            datetime=time.strftime(FILE_DATETIME_FORMAT),
             scattering_angle=self.metadata[Records.SCATTERING_ANGLE.name],
             duration=self.metadata[Records.MEASUREMENTDURATION.name],
             wavelength=self.metadata[Records.LASER_WAVELENGTH.name],
@@ -111,8 +119,12 @@ class DataFile:
             temperature=self.metadata[Records.SAMPLE_TEMP.name],
             avg_count_A=np.mean(self.data_arrays.trace_a),
             avg_count_B=np.mean(self.data_arrays.trace_b),
-            correlation_function=correlation_string,
-            count_rate_history=raw_channel_data_string,
+        )
+        self.file_sections = (
+            header,
+            correlation_string,
+            Schema.COUNT_RATE_HISTORY_HEADER,
+            raw_channel_data_string,
         )
 
     def write_to_file(self) -> None:
@@ -121,4 +133,4 @@ class DataFile:
         @return (None): None
         """
         for dat_file in [self.user_file, self.archive_file]:
-            dat_file.write(self.save_file)
+            dat_file.writelines(self.file_sections)
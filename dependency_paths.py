@@ -0,0 +1,14 @@
+"""
+Adds the directories of the LSi correlator vendor driver and the ISIS inst_servers to sys.path.
+Import this before importing anything from them.
+"""
+
+import os
+import sys
+
+EPICS_KIT_ROOT = os.environ["EPICS_KIT_ROOT"]
+VENDOR_PATH = os.path.join(EPICS_KIT_ROOT, "support", "lsicorr_vendor", "master")
+INST_SERVERS_PATH = os.path.join(EPICS_KIT_ROOT, "ISIS", "inst_servers", "master")
+
+sys.path.insert(1, VENDOR_PATH)
+sys.path.insert(2, INST_SERVERS_PATH)
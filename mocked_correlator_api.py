@@ -2,18 +2,21 @@
 Contains Mocked Correlator API for testing
 """
 
-from time import time
+import logging
+from time import monotonic
 
 import numpy as np  # pylint: disable=import-error
 from mock import MagicMock  # pylint: disable=import-error
 
-from pvdb import Records
+from pvdb import CORRELATION_FUNCTION_COUNT
 
-elements_in_float_array = Records.CORRELATION_FUNCTION.value.database_entries[
-    "CORRELATION_FUNCTION"
-]["count"]  # pylint: disable=line-too-long
+LOGGER = logging.getLogger(__name__)
 
-DATA_USED_IN_IOC_SYSTEM_TESTS = np.linspace(0, elements_in_float_array, elements_in_float_array)
+# Shared by every mocked correlator (and by the IOC PVs it is published to), so made read-only
+DATA_USED_IN_IOC_SYSTEM_TESTS = np.linspace(
+    0, CORRELATION_FUNCTION_COUNT, CORRELATION_FUNCTION_COUNT
+)
+DATA_USED_IN_IOC_SYSTEM_TESTS.setflags(write=False)
 
 
 class MockedCorrelatorAPI:
@@ -22,14 +25,19 @@ class MockedCorrelatorAPI:
     """
 
     # pylint: disable=too-many-arguments, too-many-instance-attributes
-    def __init__(self):
+    def __init__(self, collection_time: float = 1.0):
+        """
+        @param collection_time (float): Seconds a measurement runs for once started
+        """
         self.device = MagicMock()
 
         self.device.start = MagicMock(side_effect=self.start)
         self.device.configure = MagicMock(side_effect=self.configure)
 
-        self.device.MeasurementOn = MagicMock(side_effect=self.is_measurement_on)
-        self.device.update = MagicMock(side_effect=self.update)
+        # Polled in a loop while measuring and never asserted on, so these are plain methods
+        # rather than call-recording mocks
+        self.device.MeasurementOn = self.is_measurement_on
+        self.device.update = self.update
 
         self.device.measurement_on = False
         self.device.disconnected = False
@@ -41,17 +49,28 @@ class MockedCorrelatorAPI:
 
         self.update_count = 0
         self.update_called_when_measurement_not_on = False
-        self.collection_time = 1.0
-        self.last_start_time = time()
+        self.collection_time = collection_time
+        self.last_start_time = monotonic()
+
+    @property
+    def disconnected(self) -> bool:
+        """
+        Whether the mocked device is disconnected
+        """
+        return self.device.disconnected
+
+    @disconnected.setter
+    def disconnected(self, disconnected: bool) -> None:
+        self.device.disconnected = disconnected
 
     def is_measurement_on(self) -> bool:
         """
         If the collection time has passed switch the measurement off.
         Then returns whether the measurement is still on.
         """
-        if self.device.measurement_on and self.collection_time < time() - self.last_start_time:
+        if self.device.measurement_on and self.collection_time < monotonic() - self.last_start_time:
             self.device.measurement_on = False
-            print("Done!")
+            LOGGER.debug("Done!")
         return self.device.measurement_on
 
     def start(self):
@@ -60,11 +79,11 @@ class MockedCorrelatorAPI:
         Records the time measurement was started to determine elasped measurement time.
         """
         if not self.device.measurement_on:
-            print("Starting!")
+            LOGGER.debug("Starting!")
             self.device.measurement_on = True
-            self.last_start_time = time()
+            self.last_start_time = monotonic()
         else:
-            print("LSI --- Cannot start: Data connection is currently active")
+            LOGGER.warning("LSI --- Cannot start: Data connection is currently active")
 
     def configure(self):
         """
@@ -2,20 +2,20 @@
 Contains the PV definitions for the LSI_Param Enum
 """
 
-from __future__ import absolute_import, division, print_function, unicode_literals
-
-import os
 import sys
 from enum import Enum
-from functools import partial
+from functools import lru_cache
 
-sys.path.insert(1, os.path.join(os.getenv("EPICS_KIT_ROOT"), "Support", "lsicorr_vendor", "master"))
+# pylint: disable=wrong-import-order
+# Adds the vendor library path to sys.path, so must come before the LSI imports
+import dependency_paths  # noqa: F401  # isort: skip  # pylint: disable=unused-import
 
 from LSI import LSI_Param  # pylint: disable=import-error, wrong-import-position
 from LSICorrelator import LSICorrelator  # pylint: disable=import-error, wrong-import-position
 
 # pylint: disable=wrong-import-position, unused-import
 from record import (
+    BINARY_PV_FIELDS,
     CHAR_PV_FIELDS,
     FLOAT_ARRAY,
     INT_AS_FLOAT_PV,
@@ -26,36 +26,43 @@ from record import (
 )
 
 
-def convert_pv_enum_to_lsi_enum(enum_class, pv_value):
+@lru_cache(maxsize=None)
+def _enum_tables(enum_class):
     """
-    Takes the value of the enum from the PV and returns the LSI_Param associated with this value
+    Builds the lookup tables used to convert between an enum's members and their PV values.
+    Cached, so the tables are only built once per enum.
 
     Args:
         enum_class (Enum): The LSI_Param Enum containing the device parameters
-        pv_value (int): The enumerated value from the PV
-    """
-
-    # Find the enum value associated with the PV value
-    enum_as_list = []
-    for member in enum_class:
-        enum_as_list.append(member)
 
-    return enum_as_list[pv_value]
+    Returns:
+        (members, index_by_member): The enum members in order, and the index of each member
+    """
+    members = tuple(enum_class)
+    return members, {member: index for index, member in enumerate(members)}
 
 
-def convert_lsi_enum_to_pv_value(enum_class, current_state):
+def enum_converters(enum_class):
     """
-    Takes a driver parameter and returns its associated enum value for the PV
+    Creates the convert_from_pv and convert_to_pv functions for a record of an LSI_Param enum.
+    convert_from_pv takes the value of the enum from the PV and returns the associated LSI_Param.
+    convert_to_pv takes a driver parameter and returns its associated enum value for the PV.
 
     Args:
         enum_class (Enum): The LSI_Param Enum containing the device parameters
-        current_state: The Enum member to be looked up and written to the PV
+
+    Returns:
+        converters (Dict): The convert_from_pv and convert_to_pv keyword arguments for a Record
     """
-    state_name = enum_class(current_state)
-    enum_as_list = []
-    for member in enum_class:
-        enum_as_list.append(member)
-    return enum_as_list.index(state_name)
+    members, index_by_member = _enum_tables(enum_class)
+
+    def convert_from_pv(pv_value):
+        return members[pv_value]
+
+    def convert_to_pv(current_state):
+        return index_by_member[enum_class(current_state)]
+
+    return {"convert_from_pv": convert_from_pv, "convert_to_pv": convert_to_pv}
 
 
 class Records(Enum):
@@ -67,15 +74,14 @@ class Records(Enum):
     def keys():
         """
         Returns the keys of the enum
-        @return (list): The keys of the enum
+        @return (tuple): The keys of the enum
         """
-        return [member.name for member in Records]
+        return _RECORD_KEYS
 
     CORRELATIONTYPE = Record(
         "CORRELATIONTYPE",
         populate_enum_pv(LSI_Param.CorrelationType),
-        convert_to_pv=partial(convert_lsi_enum_to_pv_value, LSI_Param.CorrelationType),
-        convert_from_pv=partial(convert_pv_enum_to_lsi_enum, LSI_Param.CorrelationType),
+        **enum_converters(LSI_Param.CorrelationType),
         device_setter=LSICorrelator.setCorrelationType,
         has_setpoint=True,
     )
@@ -83,8 +89,7 @@ class Records(Enum):
     NORMALIZATION = Record(
         "NORMALIZATION",
         populate_enum_pv(LSI_Param.Normalization),
-        convert_from_pv=partial(convert_pv_enum_to_lsi_enum, LSI_Param.Normalization),
-        convert_to_pv=partial(convert_lsi_enum_to_pv_value, LSI_Param.Normalization),
+        **enum_converters(LSI_Param.Normalization),
         device_setter=LSICorrelator.setNormalization,
         has_setpoint=True,
     )
@@ -100,8 +105,7 @@ class Records(Enum):
     SWAPCHANNELS = Record(
         "SWAPCHANNELS",
         populate_enum_pv(LSI_Param.SwapChannels),
-        convert_from_pv=partial(convert_pv_enum_to_lsi_enum, LSI_Param.SwapChannels),
-        convert_to_pv=partial(convert_lsi_enum_to_pv_value, LSI_Param.SwapChannels),
+        **enum_converters(LSI_Param.SwapChannels),
         device_setter=LSICorrelator.setSwapChannels,
         has_setpoint=True,
     )
@@ -109,8 +113,7 @@ class Records(Enum):
     SAMPLINGTIMEMULTIT = Record(
         "SAMPLINGTIMEMULTIT",
         populate_enum_pv(LSI_Param.SamplingTimeMultiT),
-        convert_from_pv=partial(convert_pv_enum_to_lsi_enum, LSI_Param.SamplingTimeMultiT),
-        convert_to_pv=partial(convert_lsi_enum_to_pv_value, LSI_Param.SamplingTimeMultiT),
+        **enum_converters(LSI_Param.SamplingTimeMultiT),
         device_setter=LSICorrelator.setSamplingTimeMultiT,
         has_setpoint=True,
     )
@@ -118,8 +121,7 @@ class Records(Enum):
     TRANSFERRATE = Record(
         "TRANSFERRATE",
         populate_enum_pv(LSI_Param.TransferRate),
-        convert_from_pv=partial(convert_pv_enum_to_lsi_enum, LSI_Param.TransferRate),
-        convert_to_pv=partial(convert_lsi_enum_to_pv_value, LSI_Param.TransferRate),
+        **enum_converters(LSI_Param.TransferRate),
         device_setter=LSICorrelator.setTransferRate,
         has_setpoint=True,
     )
@@ -186,15 +188,24 @@ class Records(Enum):
 
     LASER_WAVELENGTH = Record("LASER_WAVELENGTH", float_pv_with_unit("nm"), has_setpoint=True)
 
-    SIM = Record("SIM", {"type": "enum", "enums": ["NO", "YES"]}, convert_from_pv=bool)
+    SIM = Record("SIM", BINARY_PV_FIELDS, convert_from_pv=bool)
 
-    DISABLE = Record("DISABLE", {"type": "enum", "enums": ["NO", "YES"]}, convert_from_pv=bool)
+    DISABLE = Record("DISABLE", BINARY_PV_FIELDS, convert_from_pv=bool)
 
     WAIT = Record("WAIT", float_pv_with_unit("s"), has_setpoint=True)
 
     MIN_TIME_LAG = Record("MIN_TIME_LAG", float_pv_with_unit("ns"), has_setpoint=True)
 
 
-STATIC_PV_DATABASE = {}
-for record in Records:
-    STATIC_PV_DATABASE.update(record.value.database_entries)
+_RECORD_KEYS = tuple(member.name for member in Records)
+
+# Built once at import from the entries each record generated when it was defined. The names are
+# interned so that looking them up with a record's precomputed names is an identity comparison
+STATIC_PV_DATABASE = {
+    sys.intern(pv_name): pv_definition
+    for member in Records
+    for pv_name, pv_definition in member.value.database_entries.items()
+}
+
+# Number of elements in the correlation function (and other data array) PVs
+CORRELATION_FUNCTION_COUNT = STATIC_PV_DATABASE[Records.CORRELATION_FUNCTION.name]["count"]
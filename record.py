@@ -2,8 +2,10 @@
 Contains information used to define a PCASpy PV, its fields and how its values are read and set.
 """
 
+import sys
 from enum import Enum
-from typing import Callable, Dict, Optional
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
 
 from pcaspy.alarm import AlarmStrings, SeverityStrings  # pylint: disable=import-error
 
@@ -13,6 +15,9 @@ PARAM_FIELDS_BINARY = {
     "info_field": {"archive": "VAL", "INTEREST": "HIGH"},
 }
 
+# Binary PVs which are not archived
+BINARY_PV_FIELDS = {"type": "enum", "enums": ["NO", "YES"]}
+
 INT_AS_FLOAT_PV = {
     "type": "float",
     "prec": 0,
@@ -30,15 +35,42 @@ FLOAT_ARRAY = {"type": "float", "count": 400}
 # Truncate as enum can only contain 16 states
 ALARM_STAT_PV_FIELDS = {"type": "enum", "enums": AlarmStrings[:16]}
 ALARM_SEVR_PV_FIELDS = {"type": "enum", "enums": SeverityStrings}
+# pcaspy only reads PV definitions, so records with the same fields share one definition
+NORD_PV_FIELDS = {"type": "int", "value": 0}
 
 
+@lru_cache(maxsize=None)
 def populate_enum_pv(enum: Enum):
     """
-    Creates an enum PV definition
+    Creates an enum PV definition. Cached, so records of the same enum share one definition.
     """
     return {"type": "enum", "enums": [member.name for member in enum]}
 
 
+@lru_cache(maxsize=None)
+def nelm_pv_fields(count: int) -> Dict:
+    """
+    Returns the definition of an array PV's NELM field, shared between PVs with the same count.
+    Args:
+        count: The number of elements in the array PV
+    Returns:
+        pv_definition (Dict): Contains the fields which define the PV
+    """
+    return {"type": "int", "value": count}
+
+
+@lru_cache(maxsize=None)
+def egu_pv_fields(unit: str) -> Dict:
+    """
+    Returns the definition of a PV's EGU field, shared between PVs with the same unit.
+    Args:
+        unit: The PV's unit
+    Returns:
+        pv_definition (Dict): Contains the fields which define the PV
+    """
+    return {"type": "string", "value": unit}
+
+
 def float_pv_with_unit(unit: str):
     """
     Returns a float PV definition with given unit filled in.
@@ -85,8 +117,28 @@ class Record:
         can be written to a pv. Defaults to do_nothing (no-op)
         device_setter: Function which is called when the PV is written do.
         Defaults to do_nothing (no-op)
+
+    Attributes:
+        needs_sanitize: False if both converters are no-ops, so values can be used as supplied
+        val_name: The name of the base PV's .VAL field
+        sp_name: The name of the setpoint PV, or None if the record has no setpoint
     """
 
+    # The derived names are stored with the record, as they are looked up on every PV write
+    # pylint: disable=too-many-instance-attributes
+    __slots__ = (
+        "name",
+        "pv_definition",
+        "convert_from_pv",
+        "convert_to_pv",
+        "set_on_device",
+        "has_setpoint",
+        "val_name",
+        "sp_name",
+        "needs_sanitize",
+        "database_entries",
+    )
+
     # pylint: disable=too-many-arguments
     def __init__(
         self,
@@ -103,22 +155,44 @@ class Record:
         self.convert_to_pv = convert_to_pv
         self.set_on_device = device_setter
         self.has_setpoint = has_setpoint
+        self.val_name = sys.intern(f"{name}.VAL")
+        self.sp_name = sys.intern(f"{name}:SP") if has_setpoint else None
+        self.needs_sanitize = convert_from_pv is not do_nothing or convert_to_pv is not do_nothing
         self.database_entries = self.generate_database_entries()
 
+    def sanitise(self, value: Any) -> Tuple[Any, Any]:
+        """
+        Passes a value written to the PV through both converters, so that e.g. enum values are
+        set correctly. Converters which are no-ops are skipped.
+
+        Args:
+            value: The value written to the PV
+
+        Returns:
+            (value_for_device, value_for_pv): The value to set on the device and the value to set
+            the PV to
+        """
+        if not self.needs_sanitize:
+            return value, value
+        value_for_device = self.convert_from_pv(value)
+        if self.convert_to_pv is do_nothing:
+            return value_for_device, value_for_device
+        return value_for_device, self.convert_to_pv(value_for_device)
+
     def generate_database_entries(self) -> Dict:
         """
         Compiles the list of PV definitions for fields required in this record
         """
 
-        database = {}
-        database.update({self.name: self.pv_definition})
-        database.update(self.add_standard_fields())
-
-        database.update(self.add_val_and_alarm_fields(self.name))
+        database = {
+            self.name: self.pv_definition,
+            **self.add_standard_fields(),
+            **self.add_val_and_alarm_fields(self.name),
+        }
 
         if self.has_setpoint:
-            database.update({f"{self.name}:SP": self.pv_definition})  # update base pv
-            database.update(self.add_val_and_alarm_fields(f"{self.name}:SP"))
+            database[self.sp_name] = self.pv_definition  # update base pv
+            database.update(self.add_val_and_alarm_fields(self.sp_name))
 
         return database
 
@@ -130,16 +204,11 @@ class Record:
         new_fields = {}
 
         if "count" in self.pv_definition:
-            new_fields.update(
-                {f"{self.name}.NELM": {"type": "int", "value": self.pv_definition["count"]}}
-            )
-
-            new_fields.update({f"{self.name}.NORD": {"type": "int", "value": 0}})
+            new_fields[f"{self.name}.NELM"] = nelm_pv_fields(self.pv_definition["count"])
+            new_fields[f"{self.name}.NORD"] = NORD_PV_FIELDS
 
         if "unit" in self.pv_definition:
-            new_fields.update(
-                {f"{self.name}.EGU": {"type": "string", "value": self.pv_definition["unit"]}}
-            )
+            new_fields[f"{self.name}.EGU"] = egu_pv_fields(self.pv_definition["unit"])
 
         return new_fields
 
@@ -154,10 +223,8 @@ class Record:
             new_fields: Dictionary of new fields and their pv_definitions
         """
 
-        new_fields = {}
-
-        new_fields.update({f"{base_pv}.VAL": self.pv_definition})
-        new_fields.update({f"{base_pv}.SEVR": ALARM_SEVR_PV_FIELDS})
-        new_fields.update({f"{base_pv}.STAT": ALARM_STAT_PV_FIELDS})
-
-        return new_fields
+        return {
+            f"{base_pv}.VAL": self.pv_definition,
+            f"{base_pv}.SEVR": ALARM_SEVR_PV_FIELDS,
+            f"{base_pv}.STAT": ALARM_STAT_PV_FIELDS,
+        }
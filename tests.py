@@ -2,16 +2,21 @@
 Contains Unit Tests for LSI Correlator
 """
 
+import threading
+import time
 import unittest
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, TemporaryDirectory
 
 import numpy as np  # pylint: disable=import-error
+from mock import patch  # pylint: disable=import-error
+from pcaspy import SimpleServer  # pylint: disable=import-error
 
 from correlator_driver_functions import LSiCorrelatorVendorInterface
-from pvdb import Records
+from correlator_pcaspy import LSiCorrelatorIOC, remove_non_ascii
+from pvdb import STATIC_PV_DATABASE, Records
 from test_utils import test_data
 
-# pylint: disable=line-too-long, invalid-name
+# pylint: disable=line-too-long, invalid-name, protected-access
 
 macros = {"SIMULATE": "1", "ADDR": "127.0.0.1", "FIRMWARE_REVISION": "4.0.0.3"}
 
@@ -145,5 +150,236 @@ class LSICorrelatorTests(unittest.TestCase):
                     self.assertEqual(test_actual_data, file.read())
 
 
+class LSICorrelatorIOCTests(unittest.TestCase):
+    """
+    Unit tests for the LSi Correlator IOC, run against a simulated device
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Create the PVs that the IOC driver is built on
+        """
+        SimpleServer().createPV("LSITEST:", STATIC_PV_DATABASE)
+
+    def setUp(self):
+        """
+        Set up the test case
+        """
+        data_dir = TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(data_dir.cleanup)
+        self.ioc = LSiCorrelatorIOC("", {**macros, "FILEPATH": data_dir.name})
+
+    def write_and_apply(self, reason, value):
+        """
+        Write to a PV and wait for the write to be applied
+        """
+        self.ioc.write(reason, value)
+        self.ioc._write_queue.join()
+
+    def write_together_and_apply(self, writes):
+        """
+        Write to PVs so that the writes are queued together, and wait for them to be applied.
+        Returns the writes that were applied, in the order they were applied.
+        """
+        applied_writes = []
+        release_writes = threading.Event()
+        apply_write = self.ioc._apply_write
+
+        def hold_first_write_and_apply(reason, value):
+            # Hold the worker on the first write, so the writes after it are queued together
+            if not applied_writes:
+                release_writes.wait()
+            applied_writes.append((reason, value))
+            apply_write(reason, value)
+
+        with patch.object(self.ioc, "_apply_write", side_effect=hold_first_write_and_apply):
+            # Something to hold the worker on, which is not a no-op write
+            self.ioc.write(Records.EXPERIMENTNAME.value.sp_name, "hold")
+            for reason, value in writes:
+                self.ioc.write(reason, value)
+            release_writes.set()
+            self.ioc._write_queue.join()
+
+        return applied_writes[1:]
+
+    def test_GIVEN_setpoint_written_WHEN_same_value_written_again_THEN_write_skipped_AND_WHEN_new_value_written_THEN_write_applied(
+        self,
+    ):
+        """
+        Test that a write which would not change the PV is skipped, but a changed write is applied
+        """
+        wait_sp = Records.WAIT.value.sp_name
+        self.write_and_apply(wait_sp, 2.5)
+
+        with patch.object(self.ioc, "update_pv_and_write_to_device") as update_pv:
+            self.write_and_apply(wait_sp, 2.5)
+            update_pv.assert_not_called()
+
+            self.write_and_apply(wait_sp, 5.0)
+            update_pv.assert_called_once_with(Records.WAIT.name, 5.0, update_setpoint=True)
+
+    def test_GIVEN_writes_to_several_pvs_WHEN_applied_together_THEN_applied_in_order_AND_consecutive_writes_to_a_pv_coalesced(
+        self,
+    ):
+        """
+        Test that queued writes are applied in the order they were made, only merging
+        consecutive writes to the same PV
+        """
+        angle_sp = Records.SCATTERING_ANGLE.value.sp_name
+        temp_sp = Records.SAMPLE_TEMP.value.sp_name
+
+        applied_writes = self.write_together_and_apply(
+            [(angle_sp, 90), (temp_sp, 300), (temp_sp, 310), (angle_sp, 100)]
+        )
+
+        self.assertEqual(applied_writes, [(angle_sp, 90), (temp_sp, 310), (angle_sp, 100)])
+        self.assertEqual(self.ioc.getParam(Records.SCATTERING_ANGLE.name), 100)
+        self.assertEqual(self.ioc.getParam(Records.SAMPLE_TEMP.name), 310)
+
+    def test_GIVEN_setpoint_written_before_and_after_start_WHEN_writes_applied_together_THEN_acquisition_started_with_setpoint_written_before_start(
+        self,
+    ):
+        """
+        Test that queued writes are applied in the order they were made, so an acquisition uses
+        the settings written before START
+        """
+        repetitions_sp = Records.REPETITIONS.value.sp_name
+        repetitions_at_start = []
+
+        with patch("correlator_pcaspy.ACQUISITION_POOL") as acquisition_pool:
+            acquisition_pool.submit.side_effect = lambda _: repetitions_at_start.append(
+                self.ioc.getParam(Records.REPETITIONS.name)
+            )
+            applied_writes = self.write_together_and_apply(
+                [(repetitions_sp, 3), (Records.START.name, 1), (repetitions_sp, 1)]
+            )
+
+        self.assertEqual(
+            applied_writes, [(repetitions_sp, 3), (Records.START.name, 1), (repetitions_sp, 1)]
+        )
+        self.assertEqual(repetitions_at_start, [3])
+        self.assertEqual(self.ioc.getParam(Records.REPETITIONS.name), 1)
+
+    def test_GIVEN_start_written_twice_WHEN_writes_applied_together_THEN_only_one_acquisition_started(
+        self,
+    ):
+        """
+        Test that a second START queued behind the first does not start another acquisition
+        """
+        with patch("correlator_pcaspy.ACQUISITION_POOL") as acquisition_pool:
+            self.write_together_and_apply(
+                [(Records.START.name, 1), (Records.WAIT.value.sp_name, 2), (Records.START.name, 1)]
+            )
+
+        acquisition_pool.submit.assert_called_once_with(self.ioc.take_data)
+
+    def test_GIVEN_posting_updates_fails_WHEN_writes_applied_THEN_later_writes_still_applied(
+        self,
+    ):
+        """
+        Test that the write worker keeps applying writes after posting a batch of updates fails
+        """
+        with patch.object(self.ioc, "updatePVs", side_effect=[RuntimeError("post failed"), None]):
+            self.write_and_apply(Records.SAMPLE_TEMP.value.sp_name, 310)
+            self.write_and_apply(Records.SAMPLE_TEMP.value.sp_name, 320)
+
+        self.assertEqual(self.ioc.getParam(Records.SAMPLE_TEMP.name), 320)
+
+    def test_GIVEN_metadata_read_WHEN_metadata_setpoint_written_THEN_metadata_has_new_value(
+        self,
+    ):
+        """
+        Test that the metadata saved with the data follows writes to the metadata setpoints
+        """
+        self.assertEqual(self.ioc.get_metadata()[Records.SAMPLE_TEMP.name], 298)
+
+        self.write_and_apply(Records.SAMPLE_TEMP.value.sp_name, 310)
+
+        self.assertEqual(self.ioc.get_metadata()[Records.SAMPLE_TEMP.name], 310)
+
+    def test_GIVEN_saving_data_fails_WHEN_data_taken_THEN_error_raised_on_next_repetition_AND_no_more_data_saved(
+        self,
+    ):
+        """
+        Test that an error saving data in the background stops the acquisition when the next
+        repetition waits for the save
+        """
+        self.ioc.update_pv_and_write_to_device(Records.REPETITIONS.name, 3)
+
+        with patch.object(
+            self.ioc.driver, "write_data", side_effect=OSError("disk full")
+        ) as write_data:
+            self.ioc.take_data()
+
+        write_data.assert_called_once()
+        self.assertEqual(self.ioc.getParam(Records.CURRENT_REPETITION.name), 2)
+
+    def test_GIVEN_device_raises_WHEN_data_taken_THEN_acquisition_no_longer_marked_as_started(
+        self,
+    ):
+        """
+        Test that the IOC is not left marked as taking data when an acquisition fails
+        """
+        with patch.object(
+            self.ioc.driver, "take_data", side_effect=RuntimeError("device disconnected")
+        ):
+            self.ioc.take_data()
+
+        self.assertFalse(self.ioc.already_started)
+        self.assertFalse(self.ioc.getParam(Records.TAKING_DATA.name))
+
+    def test_GIVEN_device_raises_after_data_saved_WHEN_data_taken_THEN_save_finished_AND_save_error_reported(
+        self,
+    ):
+        """
+        Test that an acquisition which fails waits for the save still running in the background,
+        and reports any error from it
+        """
+        self.ioc.update_pv_and_write_to_device(Records.REPETITIONS.name, 2)
+        take_data_calls = [self.ioc.driver.take_data]
+        saves_finished = []
+
+        def take_data_then_fail(min_time_lag):
+            # Take data for the first repetition, then fail while its data is being saved
+            if not take_data_calls:
+                raise RuntimeError("device disconnected")
+            take_data_calls.pop()(min_time_lag)
+
+        def slow_failing_save(*_):
+            time.sleep(0.2)
+            saves_finished.append(True)
+            raise OSError("disk full")
+
+        with patch.object(
+            self.ioc.driver, "take_data", side_effect=take_data_then_fail
+        ), patch.object(self.ioc.driver, "write_data", side_effect=slow_failing_save):
+            self.ioc.take_data()
+
+        self.assertEqual(saves_finished, [True])
+        self.assertIn("disk full", self.ioc.getParam(Records.ERRORMSG.name))
+        self.assertFalse(self.ioc.already_started)
+
+
+class FilenameTests(unittest.TestCase):
+    """
+    Unit tests for the data filename helpers
+    """
+
+    def test_GIVEN_text_with_disallowed_characters_WHEN_cleaned_THEN_only_ascii_alphanumerics_dashes_and_underscores_remain(
+        self,
+    ):
+        """
+        Test that characters not allowed in a filename are removed
+        """
+        self.assertEqual(remove_non_ascii("My run: sample-1_a/b\\c é.dat"), "Myrunsample-1_abcdat")
+
+    def test_GIVEN_text_with_only_allowed_characters_WHEN_cleaned_THEN_text_unchanged(self):
+        """
+        Test that text made of allowed characters is unchanged
+        """
+        self.assertEqual(remove_non_ascii("sample-1_A"), "sample-1_A")
+
+
 if __name__ == "__main__":
     unittest.main()